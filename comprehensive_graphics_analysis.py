@@ -2,75 +2,171 @@
 
 import struct
 import os
-import png
-from collections import Counter
+import mmap
+import numpy as np
+from PIL import Image
+
+try:
+    from numba import njit, prange
+except ImportError:  # Fall back to the pure-Python decode loop
+    njit = None
+
+# LZ77 marker byte and 24-bit size, read as one little-endian word
+_HEADER_UNPACK = struct.Struct('<I').unpack_from
+
+# A final back-reference can run up to 18 bytes past the declared size
+LZ77_OVERRUN = 18
+LZ77_OUT_MAX = 0x10000 + LZ77_OVERRUN
+
+def _lz77_decode(data, pos, size, out):
+    """Decode the LZ77 stream at pos into out, returns (out_len, pos)"""
+    data_len = len(data)
+
+    out_len = 0
+    while out_len < size and pos < data_len:
+        control = data[pos]
+        pos += 1
+
+        for i in range(8):
+            if out_len >= size or pos >= data_len:
+                break
+
+            if control & (0x80 >> i):  # Compressed
+                if pos + 2 > data_len:
+                    break
+                # Masking with 0xFF widens Numba's uint8 loads to a signed int
+                byte1 = data[pos] & 0xFF
+                byte2 = data[pos + 1] & 0xFF
+                pos += 2
+
+                distance = ((byte1 & 0xF) << 8) | byte2
+                length = (byte1 >> 4) + 3
+
+                if distance == 0:
+                    break
+
+                # Byte-at-a-time on purpose: matches may overlap their own output
+                for j in range(length):
+                    if out_len > distance:
+                        out[out_len] = out[out_len - distance - 1]
+                    else:
+                        out[out_len] = 0
+                    out_len += 1
+            else:  # Literal
+                out[out_len] = data[pos]
+                out_len += 1
+                pos += 1
+
+    return out_len, pos
+
+if njit is not None:
+    _lz77_decode = njit(cache=True)(_lz77_decode)
 
 def decompress_lz77_safe(data, offset):
     """Safe LZ77 decompression with better error handling"""
     try:
-        output = bytearray()
-        pos = offset
-        
-        if pos >= len(data) or data[pos] != 0x10:
+        if offset >= len(data) or data[offset] != 0x10:
             return None, "No LZ77 marker"
-        pos += 1
         
-        if pos + 3 > len(data):
+        if offset + 4 > len(data):
             return None, "Size header truncated"
-        size = data[pos] | (data[pos + 1] << 8) | (data[pos + 2] << 16)
-        pos += 3
+        size = _HEADER_UNPACK(data, offset)[0] >> 8
         
         if size == 0 or size > 0x10000:  # Sanity check
             return None, f"Invalid size: {size}"
         
-        original_pos = pos
-        while len(output) < size and pos < len(data):
-            if pos >= len(data):
-                break
-                
-            control = data[pos]
-            pos += 1
-            
-            for i in range(8):
-                if len(output) >= size or pos >= len(data):
-                    break
-                    
-                if control & 0x80:  # Compressed
-                    if pos + 2 > len(data):
-                        break
-                    byte1, byte2 = data[pos], data[pos + 1]
-                    pos += 2
-                    
-                    distance = ((byte1 & 0xF) << 8) | byte2
-                    length = (byte1 >> 4) + 3
-                    
-                    if distance == 0:
-                        break
-                        
-                    for j in range(length):
-                        if len(output) > distance:
-                            output.append(output[len(output) - distance - 1])
-                        else:
-                            output.append(0)
-                else:  # Literal
-                    output.append(data[pos])
-                    pos += 1
-                    
-                control <<= 1
+        if njit is not None:
+            data = np.frombuffer(data, dtype=np.uint8)
+            out = np.empty(LZ77_OUT_MAX, dtype=np.uint8)
+        else:
+            out = bytearray(LZ77_OUT_MAX)
+        
+        out_len, pos = _lz77_decode(data, offset + 4, size, out)
         
-        compressed_size = pos - original_pos + 4  # Include header
-        return bytes(output), f"OK ({compressed_size} compressed -> {len(output)} decompressed)"
+        compressed_size = pos - offset  # Include header
+        # Slice through a memoryview so a bytearray buffer is copied only once
+        return bytes(memoryview(out)[:out_len]), f"OK ({compressed_size} compressed -> {out_len} decompressed)"
     except Exception as e:
         return None, f"Error: {e}"
 
+if njit is not None:
+    @njit(cache=True, parallel=True)
+    def _lz77_decode_batch(data, offsets, sizes, out, out_lens, end_pos):
+        """Decode every block in parallel, block i into row i of out"""
+        for i in prange(len(offsets)):
+            out_lens[i], end_pos[i] = _lz77_decode(data, offsets[i] + 4, sizes[i], out[i])
+
+def decompress_candidates(rom_data, candidates, batch_size=1024):
+    """Decompress (offset, size) candidates in order, yields (data, status)
+
+    Candidates must come from the header scan in main, so the marker and size
+    checks in decompress_lz77_safe have already passed.
+    """
+    if njit is None:
+        for offset, size in candidates:
+            yield decompress_lz77_safe(rom_data, offset)
+        return
+    
+    if not candidates:
+        return
+    
+    rom_array = np.frombuffer(rom_data, dtype=np.uint8)
+    max_size = max(size for offset, size in candidates)
+    out = np.empty((min(len(candidates), batch_size), max_size + LZ77_OVERRUN), dtype=np.uint8)
+    
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        offsets = np.array([offset for offset, size in batch], dtype=np.int64)
+        sizes = np.array([size for offset, size in batch], dtype=np.int64)
+        out_lens = np.empty(len(batch), dtype=np.int64)
+        end_pos = np.empty(len(batch), dtype=np.int64)
+        
+        _lz77_decode_batch(rom_array, offsets, sizes, out, out_lens, end_pos)
+        
+        for i, (offset, size) in enumerate(batch):
+            out_len = int(out_lens[i])
+            compressed_size = int(end_pos[i]) - offset  # Include header
+            yield bytes(out[i, :out_len]), f"OK ({compressed_size} compressed -> {out_len} decompressed)"
+
+# Byte values typical of Game Boy tile data
+GB_PATTERN_LUT = np.zeros(256, dtype=bool)
+GB_PATTERN_LUT[[0x00, 0xFF, 0xF0, 0x0F, 0x18, 0x24, 0x42, 0x81]] = True
+
+if njit is not None:
+    @njit(cache=True)
+    def data_pattern_stats(data):
+        """Byte histogram, and tile-like 16-byte chunks in the first 256 bytes"""
+        hist = np.zeros(256, dtype=np.int64)
+        for b in data:
+            hist[b] += 1
+        
+        pattern_score = 0
+        for i in range(0, min(len(data), 256) // 16 * 16, 16):
+            non_zero = 0
+            for j in range(i, i + 16):
+                if data[j] != 0:
+                    non_zero += 1
+            if 4 <= non_zero <= 12:  # Reasonable for tile data
+                pattern_score += 1
+        return hist, pattern_score
+else:
+    def data_pattern_stats(data):
+        """Byte histogram, and tile-like 16-byte chunks in the first 256 bytes"""
+        hist = np.bincount(data, minlength=256)
+        
+        chunks = data[:min(len(data), 256) // 16 * 16].reshape(-1, 16)
+        non_zero = np.count_nonzero(chunks, axis=1)
+        pattern_score = int(np.count_nonzero((non_zero >= 4) & (non_zero <= 12)))  # Reasonable for tile data
+        return hist, pattern_score
+
 def analyze_data_patterns(data):
     """Analyze if data looks like graphics"""
     if len(data) < 64:
         return {"score": 0, "reason": "Too short"}
     
-    # Count byte frequencies
-    freq = Counter(data)
-    unique_bytes = len(freq)
+    # Count byte frequencies and tile-like chunks (tiles)
+    hist, pattern_score = data_pattern_stats(np.frombuffer(data, dtype=np.uint8))
+    unique_bytes = int(np.count_nonzero(hist))
     
     # Graphics typically have moderate entropy
     if unique_bytes < 4:
@@ -78,19 +174,8 @@ def analyze_data_patterns(data):
     if unique_bytes > 128:
         return {"score": 0, "reason": f"Too many unique bytes: {unique_bytes}"}
     
-    # Check for repeated patterns (tiles)
-    pattern_score = 0
-    for i in range(0, min(len(data), 256), 16):
-        chunk = data[i:i+16]
-        if len(chunk) == 16:
-            # Count non-zero bytes
-            non_zero = sum(1 for b in chunk if b != 0)
-            if 4 <= non_zero <= 12:  # Reasonable for tile data
-                pattern_score += 1
-    
     # Check for Game Boy specific patterns
-    gb_patterns = [0x00, 0xFF, 0xF0, 0x0F, 0x18, 0x24, 0x42, 0x81]
-    gb_score = sum(1 for pattern in gb_patterns if pattern in freq)
+    gb_score = int(np.count_nonzero(GB_PATTERN_LUT & (hist > 0)))
     
     total_score = pattern_score + gb_score + (50 - abs(unique_bytes - 32))
     return {
@@ -107,8 +192,8 @@ def test_different_formats(data, name):
     
     # Test as 2BPP Game Boy format
     try:
-        tiles = extract_2bpp_tiles(data)
-        if tiles:
+        tiles = decode_planar_2bpp(data)
+        if len(tiles):
             save_tileset(tiles, f"test_format_{name}_2bpp.png")
             results.append(f"2BPP: {len(tiles)} tiles")
     except:
@@ -116,8 +201,8 @@ def test_different_formats(data, name):
     
     # Test as 1BPP format
     try:
-        tiles = extract_1bpp_tiles(data)
-        if tiles:
+        tiles = decode_1bpp(data)
+        if len(tiles):
             save_tileset(tiles, f"test_format_{name}_1bpp.png")
             results.append(f"1BPP: {len(tiles)} tiles")
     except:
@@ -132,69 +217,36 @@ def test_different_formats(data, name):
     
     return results
 
-def extract_2bpp_tiles(data):
-    """Extract Game Boy 2BPP tiles"""
-    tiles = []
-    for i in range(0, len(data), 16):
-        if i + 16 > len(data):
-            break
-        tile_data = data[i:i + 16]
-        tile = []
-        for row in range(8):
-            if row * 2 + 1 < len(tile_data):
-                byte1 = tile_data[row * 2]
-                byte2 = tile_data[row * 2 + 1]
-                for bit in range(7, -1, -1):
-                    pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                    tile.append(pixel)
-        if len(tile) == 64:
-            tiles.append(tile)
-    return tiles
+def decode_planar_2bpp(data, reverse_bits=False):
+    """Decode Game Boy 2BPP tiles, LSB-first pixel order if reverse_bits"""
+    count = len(data) // 16
+    rows = np.frombuffer(data, dtype=np.uint8, count=count * 16).reshape(-1, 8, 2)
+    bitorder = 'little' if reverse_bits else 'big'
+    bits = np.unpackbits(rows, axis=-1, bitorder=bitorder).reshape(-1, 8, 2, 8)
+    return (bits[:, :, 0] | (bits[:, :, 1] << 1)).reshape(-1, 64)
 
-def extract_1bpp_tiles(data):
-    """Extract 1BPP tiles"""
-    tiles = []
-    for i in range(0, len(data), 8):
-        if i + 8 > len(data):
-            break
-        tile_data = data[i:i + 8]
-        tile = []
-        for byte in tile_data:
-            for bit in range(7, -1, -1):
-                pixel = (byte >> bit) & 1
-                tile.append(pixel * 3)  # Convert to 2bpp scale
-        if len(tile) == 64:
-            tiles.append(tile)
-    return tiles
+def decode_1bpp(data):
+    """Decode 1BPP tiles, scaled to the 2BPP palette"""
+    count = len(data) // 8
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=count * 8))
+    return bits.reshape(-1, 64) * 3
 
 def save_tileset(tiles, filename):
     """Save tiles as PNG"""
-    if not tiles:
+    if len(tiles) == 0:
         return False
     
     tiles_per_row = 16
     rows = (len(tiles) + tiles_per_row - 1) // tiles_per_row
+    palette = np.array([255, 170, 85, 0], dtype=np.uint8)  # Game Boy palette
     
-    colors = [255, 170, 85, 0]  # Game Boy palette
-    
-    image = []
-    for row in range(rows):
-        for y in range(8):
-            row_pixels = []
-            for col in range(tiles_per_row):
-                tile_idx = row * tiles_per_row + col
-                if tile_idx < len(tiles):
-                    tile = tiles[tile_idx]
-                    for x in range(8):
-                        pixel_value = tile[y * 8 + x]
-                        row_pixels.append(colors[pixel_value])
-                else:
-                    row_pixels.extend([255] * 8)
-            image.append(row_pixels)
+    # Pad the last row with blank tiles, then lay the tiles out as one sheet
+    sheet = np.zeros((rows * tiles_per_row, 64), dtype=np.uint8)
+    sheet[:len(tiles)] = tiles
+    sheet = sheet.reshape(rows, tiles_per_row, 8, 8).transpose(0, 2, 1, 3).reshape(rows * 8, tiles_per_row * 8)
     
-    with open(filename, 'wb') as f:
-        w = png.Writer(width=len(image[0]), height=len(image), greyscale=True)
-        w.write(f, image)
+    # zlib level 1: these are throwaway analysis images, not archival assets
+    Image.fromarray(palette[sheet]).save(filename, compress_level=1)
     return True
 
 def save_raw_bitmap(data, filename, width=128):
@@ -203,23 +255,12 @@ def save_raw_bitmap(data, filename, width=128):
     if height < 8:
         height = 8
     
-    image = []
-    for y in range(height):
-        row = []
-        for x in range(width // 8):
-            byte_idx = y * (width // 8) + x
-            if byte_idx < len(data):
-                byte_val = data[byte_idx]
-                for bit in range(7, -1, -1):
-                    pixel = 255 if (byte_val >> bit) & 1 else 0
-                    row.append(pixel)
-            else:
-                row.extend([255] * 8)
-        image.append(row)
+    # One bit per pixel, past the end of the data is left white
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=min(len(data), height * width // 8)))
+    image = np.full(height * width, 255, dtype=np.uint8)
+    image[:len(bits)] = bits * 255
     
-    with open(filename, 'wb') as f:
-        w = png.Writer(width=width, height=len(image), greyscale=True)
-        w.write(f, image)
+    Image.fromarray(image.reshape(height, width)).save(filename, compress_level=1)
 
 def main():
     rom_file = "Tetris (World) (ModRetro Chromatic) (Aftermarket) (Unl) 2.gbc"
@@ -227,16 +268,19 @@ def main():
     print("🔍 Comprehensive Graphics Analysis")
     print("=" * 60)
     
+    # Map the ROM read-only instead of copying it into a bytes object
     with open(rom_file, 'rb') as f:
-        rom_data = f.read()
+        rom_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     
     # Find all LZ77 candidates
-    candidates = []
-    for offset in range(0, len(rom_data) - 4):
-        if rom_data[offset] == 0x10:
-            size = rom_data[offset + 1] | (rom_data[offset + 2] << 8) | (rom_data[offset + 3] << 16)
-            if 0x80 <= size <= 0x4000:  # Reasonable graphics size
-                candidates.append((offset, size))
+    rom_array = np.frombuffer(rom_data, dtype=np.uint8)
+    n = max(len(rom_array) - 4, 0)
+    is_marker = rom_array[:n] == 0x10
+    sizes = (rom_array[1:n + 1].astype(np.uint32)
+             | (rom_array[2:n + 2].astype(np.uint32) << 8)
+             | (rom_array[3:n + 3].astype(np.uint32) << 16))
+    mask = is_marker & (sizes >= 0x80) & (sizes <= 0x4000)  # Reasonable graphics size
+    candidates = list(zip(np.flatnonzero(mask).tolist(), sizes[mask].tolist()))
     
     print(f"Found {len(candidates)} LZ77 candidates")
     
@@ -244,8 +288,9 @@ def main():
     os.makedirs("analysis_results", exist_ok=True)
     good_candidates = []
     
-    for i, (offset, expected_size) in enumerate(candidates):
-        data, status = decompress_lz77_safe(rom_data, offset)
+    # Decompression runs in parallel batches ahead of the analysis below
+    decoded = decompress_candidates(rom_data, candidates)
+    for i, ((offset, expected_size), (data, status)) in enumerate(zip(candidates, decoded)):
         
         bank = offset // 0x4000
         local_offset = offset % 0x4000
@@ -2,10 +2,18 @@
 
 import struct
 import os
-import png
-from collections import Counter
+import hashlib
+import mmap
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import subprocess
 
+try:
+    from numba import njit
+except ImportError:  # Fall back to NumPy reductions
+    njit = None
+
 def find_tetris_patterns(rom_data):
     """Look for classic Tetris piece patterns in ROM"""
     
@@ -26,252 +34,363 @@ def find_tetris_patterns(rom_data):
     print("🔍 Searching for Tetris piece patterns...")
     found_patterns = []
     
+    # Every pattern is one 8-byte tile, so all of them can be matched in a
+    # single pass over the 8-byte key at each ROM position: a binary search
+    # of the sorted pattern keys, whatever the number of patterns
+    pattern_ids = {}
     for piece_name, patterns in tetris_patterns.items():
         for pattern_idx, pattern in enumerate(patterns):
-            pattern_bytes = bytes(pattern)
-            
-            # Search for this pattern in ROM
-            pos = 0
-            while True:
-                pos = rom_data.find(pattern_bytes, pos)
-                if pos == -1:
-                    break
-                
-                bank = pos // 0x4000
-                local_addr = pos % 0x4000
-                found_patterns.append({
-                    'piece': piece_name,
-                    'pattern': pattern_idx,
-                    'address': pos,
-                    'bank': bank,
-                    'local': local_addr
-                })
-                print(f"   Found {piece_name}[{pattern_idx}] at Bank {bank:02X}:${local_addr:04X} (${pos:06X})")
-                pos += 1
+            pattern_ids[int.from_bytes(bytes(pattern), 'little')] = (piece_name, pattern_idx)
+    pattern_keys = np.array(sorted(pattern_ids), dtype=np.uint64)
+    
+    hits = []
+    hit_keys = []
+    n_keys = max(len(rom_data) - 7, 0)
+    for start in range(0, n_keys, KEY_BLOCK):
+        # Keys are built a block at a time so memory doesn't grow with the ROM
+        keys = rom_tile_keys(rom_data, start, min(start + KEY_BLOCK, n_keys))
+        idx = np.searchsorted(pattern_keys, keys)
+        np.minimum(idx, len(pattern_keys) - 1, out=idx)
+        block_hits = np.flatnonzero(pattern_keys[idx] == keys)
+        hits.append(block_hits + start)
+        hit_keys.append(keys[block_hits])
+    hits = np.concatenate(hits) if hits else np.zeros(0, dtype=np.intp)
+    hit_keys = np.concatenate(hit_keys) if hit_keys else np.zeros(0, dtype=np.uint64)
+    
+    for key, (piece_name, pattern_idx) in pattern_ids.items():
+        for pos in hits[hit_keys == key].tolist():
+            bank = pos // 0x4000
+            local_addr = pos % 0x4000
+            found_patterns.append({
+                'piece': piece_name,
+                'pattern': pattern_idx,
+                'address': pos,
+                'bank': bank,
+                'local': local_addr
+            })
+            print(f"   Found {piece_name}[{pattern_idx}] at Bank {bank:02X}:${local_addr:04X} (${pos:06X})")
     
     return found_patterns
 
+# ROM positions keyed per block by find_tetris_patterns, 512KB of keys each
+KEY_BLOCK = 0x10000
+
+def rom_tile_keys(rom_data, start, stop):
+    """Little-endian uint64 of the 8 bytes starting at each ROM position in [start, stop)"""
+    keys = np.empty(stop - start, dtype=np.uint64)
+    # Position start + k + 8j is word j of the ROM read from byte start + k
+    for k in range(min(8, len(keys))):
+        count = (len(keys) - k + 7) // 8
+        keys[k::8] = np.frombuffer(rom_data, dtype='<u8', count=count, offset=start + k)
+    return keys
+
 def extract_surrounding_graphics(rom_data, address, size=1024):
     """Extract graphics around a found pattern"""
     start = max(0, address - size // 2)
     end = min(len(rom_data), address + size // 2)
-    return rom_data[start:end], start
+    return memoryview(rom_data)[start:end], start
 
-def test_all_possible_formats(data, name):
-    """Test data in every possible graphics format"""
+# Formats found for each window already tested, keyed by window_digest
+_tested_windows = {}
+
+def window_digest(data):
+    """Short SHA-256 prefix identifying a window by its contents"""
+    return hashlib.sha256(data).digest()[:8]
+
+def test_all_possible_formats(data):
+    """Test data in every possible graphics format, returns tiles per format"""
+    digest = window_digest(data)
+    if digest not in _tested_windows:
+        _tested_windows[digest] = decode_all_formats(data)
+    return _tested_windows[digest]  # Shared by every window with the same bytes
+
+def decode_all_formats(data):
+    """Decode data in every format without the window cache, for the workers"""
     formats_tested = {}
     
     # Standard 2BPP
     try:
-        tiles = extract_2bpp_standard(data)
-        if tiles and has_meaningful_patterns(tiles):
-            save_tileset(tiles, f"final_test/{name}_2bpp_standard.png")
-            formats_tested['2bpp_standard'] = len(tiles)
+        tiles = decode_planar_2bpp(data)
+        if has_meaningful_patterns(tiles):
+            formats_tested['2bpp_standard'] = tiles
     except: pass
     
     # 2BPP with different bit ordering
     try:
-        tiles = extract_2bpp_reversed(data)
-        if tiles and has_meaningful_patterns(tiles):
-            save_tileset(tiles, f"final_test/{name}_2bpp_reversed.png")
-            formats_tested['2bpp_reversed'] = len(tiles)
+        tiles = decode_planar_2bpp(data, reverse_bits=True)
+        if has_meaningful_patterns(tiles):
+            formats_tested['2bpp_reversed'] = tiles
     except: pass
     
     # 1BPP
     try:
-        tiles = extract_1bpp(data)
-        if tiles and has_meaningful_patterns(tiles):
-            save_tileset(tiles, f"final_test/{name}_1bpp.png")
-            formats_tested['1bpp'] = len(tiles)
+        tiles = decode_1bpp(data)
+        if has_meaningful_patterns(tiles):
+            formats_tested['1bpp'] = tiles
     except: pass
     
     # Planar format (planes separated)
     try:
         tiles = extract_planar(data)
-        if tiles and has_meaningful_patterns(tiles):
-            save_tileset(tiles, f"final_test/{name}_planar.png")
-            formats_tested['planar'] = len(tiles)
+        if has_meaningful_patterns(tiles):
+            formats_tested['planar'] = tiles
     except: pass
     
     # 4BPP format (for GBC)
     try:
         tiles = extract_4bpp(data)
-        if tiles and has_meaningful_patterns(tiles):
-            save_tileset(tiles, f"final_test/{name}_4bpp.png")
-            formats_tested['4bpp'] = len(tiles)
+        if has_meaningful_patterns(tiles):
+            formats_tested['4bpp'] = tiles
     except: pass
     
     return formats_tested
 
-def extract_2bpp_standard(data):
-    """Standard Game Boy 2BPP"""
-    tiles = []
-    for i in range(0, len(data), 16):
-        if i + 16 > len(data): break
-        tile_data = data[i:i + 16]
-        tile = []
-        for row in range(8):
-            if row * 2 + 1 < len(tile_data):
-                byte1 = tile_data[row * 2]
-                byte2 = tile_data[row * 2 + 1]
-                for bit in range(7, -1, -1):
-                    pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                    tile.append(pixel)
-        if len(tile) == 64: tiles.append(tile)
-    return tiles
-
-def extract_2bpp_reversed(data):
-    """2BPP with bit order reversed"""
-    tiles = []
-    for i in range(0, len(data), 16):
-        if i + 16 > len(data): break
-        tile_data = data[i:i + 16]
-        tile = []
-        for row in range(8):
-            if row * 2 + 1 < len(tile_data):
-                byte1 = tile_data[row * 2]
-                byte2 = tile_data[row * 2 + 1]
-                for bit in range(8):  # Forward instead of reverse
-                    pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                    tile.append(pixel)
-        if len(tile) == 64: tiles.append(tile)
-    return tiles
-
-def extract_1bpp(data):
-    """1 bit per pixel"""
-    tiles = []
-    for i in range(0, len(data), 8):
-        if i + 8 > len(data): break
-        tile_data = data[i:i + 8]
-        tile = []
-        for byte in tile_data:
-            for bit in range(7, -1, -1):
-                pixel = ((byte >> bit) & 1) * 3
-                tile.append(pixel)
-        if len(tile) == 64: tiles.append(tile)
-    return tiles
+def format_counts(formats):
+    """Tile count per format, for reporting"""
+    return {fmt: len(tiles) for fmt, tiles in formats.items()}
+
+def save_formats(formats, name, io_pool=None):
+    """Save every decoded format of a region as PNG, in the background if given an io_pool"""
+    for fmt, tiles in formats.items():
+        filename = f"final_test/{name}_{fmt}.png"
+        if io_pool is None:
+            save_tileset(tiles, filename)
+        else:
+            # Decoded tiles are never modified afterwards, so no copy is needed
+            io_pool.submit(save_tileset, tiles, filename)
+
+def score_tiles(tiles):
+    """Rank decoded tiles by how much they look like real graphics"""
+    sample = tiles[:16]
+    
+    # Same tiles has_meaningful_patterns counts: not empty, not solid
+    non_zero_pixels = np.count_nonzero(sample, axis=1)
+    meaningful = np.count_nonzero((non_zero_pixels >= 4) & (non_zero_pixels <= 60)) / len(sample)
+    
+    # Real tiles vary within themselves and use the whole 4-shade palette
+    variance = sample.var(axis=1).mean() / 2.25  # Largest variance of 0-3 values
+    shades = len(np.unique(sample)) / 4
+    
+    return float(meaningful + variance + shades)
+
+def score_formats(formats):
+    """Score of the best-looking format found for a region"""
+    return max(score_tiles(tiles) for tiles in formats.values())
+
+def decode_planar_2bpp(data, reverse_bits=False):
+    """Decode Game Boy 2BPP tiles, LSB-first pixel order if reverse_bits"""
+    count = len(data) // 16
+    rows = np.frombuffer(data, dtype=np.uint8, count=count * 16).reshape(-1, 8, 2)
+    bitorder = 'little' if reverse_bits else 'big'
+    bits = np.unpackbits(rows, axis=-1, bitorder=bitorder).reshape(-1, 8, 2, 8)
+    return (bits[:, :, 0] | (bits[:, :, 1] << 1)).reshape(-1, 64)
+
+def decode_1bpp(data):
+    """Decode 1BPP tiles, scaled to the 2BPP palette"""
+    count = len(data) // 8
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=count * 8))
+    return bits.reshape(-1, 64) * 3
 
 def extract_planar(data):
     """Planar format - all plane 1 bytes, then all plane 2 bytes"""
-    tiles = []
     half = len(data) // 2
-    plane1 = data[:half]
-    plane2 = data[half:]
-    
-    for i in range(0, min(len(plane1), len(plane2)), 8):
-        if i + 8 > len(plane1): break
-        tile = []
-        for row in range(8):
-            if row < len(plane1[i:i+8]) and row < len(plane2[i:i+8]):
-                byte1 = plane1[i + row]
-                byte2 = plane2[i + row]
-                for bit in range(7, -1, -1):
-                    pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                    tile.append(pixel)
-        if len(tile) == 64: tiles.append(tile)
-    return tiles
+    count = half // 8
+    plane1 = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=count * 8))
+    plane2 = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=count * 8, offset=half))
+    return (plane1 | (plane2 << 1)).reshape(-1, 64)
 
 def extract_4bpp(data):
     """4 bits per pixel (GBC mode)"""
-    tiles = []
-    for i in range(0, len(data), 32):  # 32 bytes per tile in 4BPP
-        if i + 32 > len(data): break
-        tile_data = data[i:i + 32]
-        tile = []
-        for row in range(8):
-            row_start = row * 4
-            if row_start + 4 <= len(tile_data):
-                for byte_idx in range(4):
-                    byte_val = tile_data[row_start + byte_idx]
-                    # Extract 2 pixels per byte
-                    pixel1 = (byte_val >> 4) & 0xF
-                    pixel2 = byte_val & 0xF
-                    tile.extend([pixel1 % 4, pixel2 % 4])  # Clamp to 2bpp for display
-        if len(tile) == 64: tiles.append(tile)
-    return tiles
+    count = len(data) // 32  # 32 bytes per tile in 4BPP
+    tile_data = np.frombuffer(data, dtype=np.uint8, count=count * 32).reshape(-1, 32)
+    # Extract 2 pixels per byte, clamped to 2bpp for display
+    pixels = np.stack((tile_data >> 4, tile_data), axis=-1) & 3
+    return pixels.reshape(-1, 64)
+
+if njit is not None:
+    @njit(cache=True)
+    def count_meaningful_tiles(tiles):
+        """Count tiles among the first 16 that are neither empty nor solid"""
+        count = 0
+        for t in range(min(len(tiles), 16)):
+            non_zero_pixels = 0
+            for p in range(64):
+                if tiles[t, p] != 0:
+                    non_zero_pixels += 1
+            if 4 <= non_zero_pixels <= 60:
+                count += 1
+        return count
+else:
+    def count_meaningful_tiles(tiles):
+        """Count tiles among the first 16 that are neither empty nor solid"""
+        non_zero_pixels = np.count_nonzero(tiles[:16], axis=1)
+        return np.count_nonzero((non_zero_pixels >= 4) & (non_zero_pixels <= 60))
 
 def has_meaningful_patterns(tiles):
     """Check if tiles contain meaningful patterns vs noise"""
-    if not tiles or len(tiles) < 4:
+    if len(tiles) < 4:
         return False
     
-    # Count non-empty tiles
-    non_empty = 0
-    for tile in tiles[:16]:  # Check first 16 tiles
-        non_zero_pixels = sum(1 for p in tile if p != 0)
-        if 4 <= non_zero_pixels <= 60:  # Not empty, not solid
-            non_empty += 1
-    
-    return non_empty >= 2
+    return count_meaningful_tiles(tiles) >= 2
 
 def save_tileset(tiles, filename, tiles_per_row=16):
     """Save tiles as PNG"""
-    if not tiles: return False
+    if len(tiles) == 0: return False
     
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     rows = (len(tiles) + tiles_per_row - 1) // tiles_per_row
-    colors = [255, 170, 85, 0]
-    
-    image = []
-    for row in range(rows):
-        for y in range(8):
-            row_pixels = []
-            for col in range(tiles_per_row):
-                tile_idx = row * tiles_per_row + col
-                if tile_idx < len(tiles):
-                    tile = tiles[tile_idx]
-                    for x in range(8):
-                        pixel_value = tile[y * 8 + x]
-                        row_pixels.append(colors[pixel_value])
-                else:
-                    row_pixels.extend([255] * 8)
-            image.append(row_pixels)
-    
-    with open(filename, 'wb') as f:
-        w = png.Writer(width=len(image[0]), height=len(image), greyscale=True)
-        w.write(f, image)
+    palette = np.array([255, 170, 85, 0], dtype=np.uint8)  # Game Boy palette
+    
+    # Pad the last row with blank tiles, then lay the tiles out as one sheet
+    sheet = np.zeros((rows * tiles_per_row, 64), dtype=np.uint8)
+    sheet[:len(tiles)] = tiles
+    sheet = sheet.reshape(rows, tiles_per_row, 8, 8).transpose(0, 2, 1, 3).reshape(rows * 8, tiles_per_row * 8)
+    
+    # zlib level 1: these are throwaway analysis images, not archival assets
+    Image.fromarray(palette[sheet]).save(filename, compress_level=1)
     return True
 
-def brute_force_graphics_search(rom_data):
+_worker_rom = None
+
+# Windows decode in well under a millisecond each, fewer than this finish
+# in process before a pool of workers would have started
+MIN_PARALLEL_WINDOWS = 4096
+
+def map_rom(rom_file):
+    """Memory-map the ROM read-only so slices of it don't copy"""
+    with open(rom_file, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _init_worker(rom_file):
+    """Map the ROM once per worker, the OS shares its pages between them"""
+    global _worker_rom
+    _worker_rom = memoryview(map_rom(rom_file))
+
+def window_histograms(rom_data):
+    """Byte histogram of every 1KB window at 512-byte steps"""
+    rom_array = np.frombuffer(rom_data, dtype=np.uint8)
+    n_windows = len(range(0, len(rom_array) - 1024, 512))
+    if n_windows == 0:
+        return np.zeros((0, 256), dtype=np.intp)
+    
+    # Adjacent windows share a 512-byte block, so histogram each block once
+    # and add neighbouring pairs instead of recounting every window
+    blocks = rom_array[:(n_windows + 1) * 512].reshape(-1, 512)
+    rows = np.arange(len(blocks)).repeat(512)
+    block_hist = np.bincount(rows * 256 + blocks.ravel(), minlength=len(blocks) * 256).reshape(-1, 256)
+    return block_hist[:-1] + block_hist[1:]
+
+# One row per 1KB window at 512-byte steps, filled in by scan_rom
+WINDOW_DTYPE = np.dtype([
+    ('offset', np.int64),
+    ('unique_bytes', np.int16),
+])
+
+def scan_rom(rom_data):
+    """Annotate every 1KB window of the ROM in a single pass"""
+    hist = window_histograms(rom_data)
+    windows = np.zeros(len(hist), dtype=WINDOW_DTYPE)
+    windows['offset'] = np.arange(len(hist)) * 512
+    windows['unique_bytes'] = np.count_nonzero(hist, axis=1)
+    return windows
+
+def process_region(offset):
+    """Test the 1KB ROM region at offset, returns (offset, formats)"""
+    region = _worker_rom[offset:offset + 1024]
+    
+    # Test all formats, the parent caches the result by digest
+    return offset, decode_all_formats(region)
+
+def brute_force_graphics_search(rom_data, rom_file, windows=None):
     """Try to find graphics by brute force searching every possible location"""
     print("🔥 Brute force graphics search...")
     
     os.makedirs("final_test", exist_ok=True)
     promising_regions = []
     
-    # Test every 1KB region in the ROM
-    for offset in range(0, len(rom_data) - 1024, 512):
-        region = rom_data[offset:offset + 1024]
-        
-        # Quick quality check
-        freq = Counter(region)
-        unique_bytes = len(freq)
+    # Quick quality check of every 1KB region in the ROM before decoding any
+    if windows is None:
+        windows = scan_rom(rom_data)
+    unique_bytes = windows['unique_bytes']
+    survivors = windows[(unique_bytes >= 16) & (unique_bytes <= 64)]  # Reasonable for graphics
+    offsets = survivors['offset'].tolist()
+    
+    # Identical windows (including ones tested around Tetris patterns) only
+    # need decoding once, so dispatch just the first occurrence of each
+    rom_view = memoryview(rom_data)
+    digests = [window_digest(rom_view[offset:offset + 1024]) for offset in offsets]
+    dispatch = []
+    queued = set()
+    for offset, digest in zip(offsets, digests):
+        if digest not in _tested_windows and digest not in queued:
+            queued.add(digest)
+            dispatch.append(offset)
+    
+    # Test the survivors, sharded across worker processes when there are
+    # enough of them to pay for starting the workers
+    executor = None
+    if len(dispatch) >= MIN_PARALLEL_WINDOWS and (os.cpu_count() or 1) > 1:
+        executor = ProcessPoolExecutor(initializer=_init_worker, initargs=(rom_file,))
+        # map() yields in submission order, so results stay deterministic
+        results = (formats for _, formats in executor.map(process_region, dispatch, chunksize=64))
+    else:
+        results = (decode_all_formats(rom_view[offset:offset + 1024]) for offset in dispatch)
+    
+    for offset, digest in zip(offsets, digests):
+        if digest not in _tested_windows:
+            _tested_windows[digest] = next(results)  # First occurrence, next in line
         
-        if 16 <= unique_bytes <= 64:  # Reasonable for graphics
+        formats = _tested_windows[digest]
+        if formats:
             bank = offset // 0x4000
             local = offset % 0x4000
-            
-            # Test all formats
-            formats = test_all_possible_formats(region, f"bank_{bank:02X}_{local:04X}")
-            
-            if formats:
-                promising_regions.append((offset, formats))
-                print(f"   Bank {bank:02X}:${local:04X} - Found formats: {formats}")
+            promising_regions.append((offset, digest, formats))
+            print(f"   Bank {bank:02X}:${local:04X} - Found formats: {format_counts(formats)}")
+    
+    if executor is not None:
+        executor.shutdown()
     
+    # Score everything in memory, best first, PNGs are only written for the top
+    promising_regions.sort(key=lambda region: score_formats(region[2]), reverse=True)
     return promising_regions
 
+def save_best_regions(promising_regions, io_pool=None, max_saved=50):
+    """Save PNGs for the best max_saved distinct windows of a sorted search result"""
+    # Copies of a window score the same and would sort next to each other,
+    # so save each distinct window once, at its first offset in score order
+    saved = set()
+    repeats = 0
+    for offset, digest, formats in promising_regions:
+        if len(saved) >= max_saved:
+            break
+        if digest in saved:
+            repeats += 1
+            continue
+        saved.add(digest)
+        bank = offset // 0x4000
+        local = offset % 0x4000
+        save_formats(formats, f"bank_{bank:02X}_{local:04X}", io_pool)
+    if repeats:
+        print(f"   Skipped {repeats} regions with the same bytes as a saved one")
+
 def main():
     rom_file = "Tetris (World) (ModRetro Chromatic) (Aftermarket) (Unl) 2.gbc"
     
     print("🎯 Final Graphics Extraction Attempt")
     print("=" * 60)
     
-    with open(rom_file, 'rb') as f:
-        rom_data = f.read()
+    rom_data = map_rom(rom_file)
+    
+    # Annotate the ROM once up front, later steps only filter the result
+    windows = scan_rom(rom_data)
     
     # Step 1: Look for known Tetris patterns
     tetris_patterns = find_tetris_patterns(rom_data)
     
+    # PNGs are written once the search is done, so no threads are running
+    # when it forks its workers
+    pattern_saves = []
+    
     if tetris_patterns:
         print(f"\n✅ Found {len(tetris_patterns)} Tetris patterns!")
         
@@ -284,23 +403,30 @@ def main():
             local = start_addr % 0x4000
             name = f"tetris_{pattern['piece']}_{bank:02X}_{local:04X}"
             
-            formats = test_all_possible_formats(data, name)
+            formats = test_all_possible_formats(data)
             if formats:
-                print(f"   Pattern at ${addr:06X} -> formats: {formats}")
+                pattern_saves.append((formats, name))
+                print(f"   Pattern at ${addr:06X} -> formats: {format_counts(formats)}")
     else:
         print("❌ No classic Tetris patterns found")
     
     # Step 2: Brute force search
     print(f"\n🔥 Brute force searching entire ROM...")
-    promising = brute_force_graphics_search(rom_data)
+    promising = brute_force_graphics_search(rom_data, rom_file, windows)
+    
+    # Write the PNGs in the background, so saving one doesn't wait on the last
+    with ThreadPoolExecutor(max_workers=2) as io_pool:
+        for formats, name in pattern_saves:
+            save_formats(formats, name, io_pool)
+        save_best_regions(promising, io_pool)
     
     if promising:
         print(f"\n✅ Found {len(promising)} promising regions!")
         print("\nBest candidates:")
-        for offset, formats in promising[:10]:
+        for offset, digest, formats in promising[:10]:
             bank = offset // 0x4000
             local = offset % 0x4000
-            print(f"   Bank {bank:02X}:${local:04X} - {formats}")
+            print(f"   Bank {bank:02X}:${local:04X} - {format_counts(formats)}")
     
     print(f"\n🎉 Analysis complete!")
     print(f"Check the final_test/ folder for extracted graphics.")
@@ -2,12 +2,18 @@
 
 import struct
 import os
-from collections import Counter
+import mmap
+import numpy as np
+
+# Bit patterns typical of sprites/tiles
+TILE_PATTERN_LUT = np.zeros(256, dtype=bool)
+TILE_PATTERN_LUT[[0x18, 0x24, 0x42, 0x81, 0x7E, 0xC3]] = True
 
 def analyze_homebrew_rom(filename):
     """Analyze homebrew ROM for custom patterns"""
+    # Map the ROM read-only instead of copying it into a bytes object
     with open(filename, 'rb') as f:
-        rom_data = f.read()
+        rom_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     
     print("🏠 Homebrew ROM Analysis")
     print("=" * 50)
@@ -68,30 +74,35 @@ def analyze_homebrew_rom(filename):
     }
     
     for sig, name in homebrew_sigs.items():
-        if sig in rom_data:
+        if rom_data.find(sig) != -1:  # 'in' on an mmap only tests for single byte values
             print(f"✅ Found: {name}")
     
     # Look for custom compression markers
     print("\n🗜️  Custom Compression Analysis:")
     
-    # Count different compression markers
+    # One histogram of the whole ROM serves every byte count below
+    hist = np.bincount(np.frombuffer(rom_data, dtype=np.uint8), minlength=256)
+    
+    # Count different compression markers, not counting the final byte
+    marker_hist = hist.copy()
+    if rom_data:
+        marker_hist[rom_data[-1]] -= 1
     markers = {}
-    for i in range(len(rom_data) - 1):
-        byte = rom_data[i]
-        if byte in [0x10, 0x11, 0x20, 0x30, 0x40]:  # Common compression markers
-            markers[byte] = markers.get(byte, 0) + 1
+    for byte in [0x10, 0x11, 0x20, 0x30, 0x40]:  # Common compression markers
+        if marker_hist[byte]:
+            markers[byte] = int(marker_hist[byte])
     
     for marker, count in sorted(markers.items()):
         print(f"   0x{marker:02X}: {count} occurrences")
     
     # Analyze byte frequency for entropy
     print("\n📊 Data Entropy Analysis:")
-    freq = Counter(rom_data)
-    entropy_score = len(freq) / 256 * 100
-    print(f"   Unique bytes: {len(freq)}/256 ({entropy_score:.1f}%)")
+    unique_bytes = int(np.count_nonzero(hist))
+    entropy_score = unique_bytes / 256 * 100
+    print(f"   Unique bytes: {unique_bytes}/256 ({entropy_score:.1f}%)")
     
-    # Most common bytes
-    most_common = freq.most_common(5)
+    # Most common bytes, ties in byte order
+    most_common = [(byte, int(hist[byte])) for byte in np.argsort(-hist, kind='stable')[:5].tolist() if hist[byte]]
     print("   Most common bytes:")
     for byte, count in most_common:
         percentage = count / len(rom_data) * 100
@@ -104,14 +115,17 @@ def analyze_homebrew_rom(filename):
     chunk_size = 1024
     low_entropy_regions = []
     
-    for i in range(0, len(rom_data) - chunk_size, chunk_size):
-        chunk = rom_data[i:i + chunk_size]
-        chunk_freq = Counter(chunk)
-        unique_ratio = len(chunk_freq) / min(256, len(chunk))
-        
+    # Mark which byte values occur in each chunk, all chunks at once
+    n_chunks = len(range(0, len(rom_data) - chunk_size, chunk_size))
+    chunks = np.frombuffer(rom_data, dtype=np.uint8, count=n_chunks * chunk_size).reshape(-1, chunk_size)
+    present = np.zeros((n_chunks, 256), dtype=bool)
+    present[np.arange(n_chunks).repeat(chunk_size), chunks.ravel()] = True
+    unique_ratios = np.count_nonzero(present, axis=1) / 256
+    
+    for chunk_idx, unique_ratio in enumerate(unique_ratios.tolist()):
         # Graphics typically have moderate entropy (not too high, not too low)
         if 0.1 < unique_ratio < 0.4:
-            low_entropy_regions.append((i, unique_ratio))
+            low_entropy_regions.append((chunk_idx * chunk_size, unique_ratio))
     
     print(f"   Found {len(low_entropy_regions)} potential graphics regions:")
     for addr, ratio in low_entropy_regions[:10]:  # Show first 10
@@ -121,17 +135,16 @@ def analyze_homebrew_rom(filename):
     
     # Check for tile-like patterns
     print("\n🧩 Tile Pattern Analysis:")
-    tile_patterns = 0
-    for i in range(0, len(rom_data) - 16, 16):
-        chunk = rom_data[i:i + 16]
-        
-        # Check if it looks like 2BPP tile data
-        non_zero = sum(1 for b in chunk if b != 0)
-        if 4 <= non_zero <= 12:  # Reasonable for tile data
-            # Check for bit patterns typical of sprites/tiles
-            has_pattern = any(b in [0x18, 0x24, 0x42, 0x81, 0x7E, 0xC3] for b in chunk)
-            if has_pattern:
-                tile_patterns += 1
+    n_tiles = len(range(0, len(rom_data) - 16, 16))
+    tiles = np.frombuffer(rom_data, dtype=np.uint8, count=n_tiles * 16).reshape(-1, 16)
+    
+    # Check if it looks like 2BPP tile data
+    non_zero = np.count_nonzero(tiles, axis=1)
+    tile_like = (non_zero >= 4) & (non_zero <= 12)  # Reasonable for tile data
+    
+    # Check for bit patterns typical of sprites/tiles
+    has_pattern = TILE_PATTERN_LUT[tiles].any(axis=1)
+    tile_patterns = int(np.count_nonzero(tile_like & has_pattern))
     
     print(f"   Found {tile_patterns} potential tile patterns")
     
@@ -1,152 +1,253 @@
 #!/usr/bin/env python3
 
+import argparse
 import struct
 import os
+import mmap
 import png
-from collections import Counter
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Fall back to the pure-Python decode loop
+    njit = None
+
+# LZ77 marker byte and 24-bit size, read as one little-endian word
+_HEADER_UNPACK = struct.Struct('<I').unpack_from
+
+# A final back-reference can run up to 18 bytes past the declared size
+LZ77_OVERRUN = 18
+
+# Smallest decompressed block worth looking at as tiles
+MIN_LZ77_OUTPUT = 256
+
+def _lz77_decode(data, pos, size, out):
+    """Decode the LZ77 stream at pos into out, returns (out_len, pos)"""
+    data_len = len(data)
+
+    out_len = 0
+    while out_len < size and pos < data_len:
+        control = data[pos]
+        pos += 1
+
+        for i in range(8):
+            if out_len >= size or pos >= data_len:
+                break
+
+            if control & (0x80 >> i):  # Compressed
+                if pos + 2 > data_len:
+                    break
+                # Masking with 0xFF widens Numba's uint8 loads to a signed int
+                byte1 = data[pos] & 0xFF
+                byte2 = data[pos + 1] & 0xFF
+                pos += 2
+
+                distance = ((byte1 & 0xF) << 8) | byte2
+                length = (byte1 >> 4) + 3
+
+                if distance == 0:
+                    break
+
+                if out_len > distance:
+                    # The match repeats the last distance + 1 bytes. Copy it in
+                    # slices that never read past what is already written: the
+                    # whole run if it doesn't overlap, else doubling chunks
+                    # (a distance of 1 is a run-length fill of 2-byte pairs)
+                    src = out_len - distance - 1
+                    copied = 0
+                    while copied < length:
+                        n = min(distance + 1 + copied, length - copied)
+                        out[out_len + copied:out_len + copied + n] = out[src:src + n]
+                        copied += n
+                    out_len += length
+                    continue
+
+                # Matches reaching before the start of the output read zeros there
+                for j in range(length):
+                    if out_len > distance:
+                        out[out_len] = out[out_len - distance - 1]
+                    else:
+                        out[out_len] = 0
+                    out_len += 1
+            else:  # Literal
+                out[out_len] = data[pos]
+                out_len += 1
+                pos += 1
+
+    return out_len, pos
+
+if njit is not None:
+    _lz77_decode = njit(cache=True)(_lz77_decode)
 
 def decompress_lz77_safe(data, offset):
     """Safe LZ77 decompression with validation"""
     try:
-        output = bytearray()
-        pos = offset
-        
-        if pos >= len(data) or data[pos] != 0x10:
+        if offset >= len(data) or data[offset] != 0x10:
             return None, "No LZ77 marker"
-        pos += 1
         
-        if pos + 3 > len(data):
+        if offset + 4 > len(data):
             return None, "Size header truncated"
-        size = data[pos] | (data[pos + 1] << 8) | (data[pos + 2] << 16)
-        pos += 3
+        size = _HEADER_UNPACK(data, offset)[0] >> 8
         
         if size == 0 or size > 0x10000:
             return None, f"Invalid size: {size}"
         
-        start_pos = pos
-        while len(output) < size and pos < len(data):
-            if pos >= len(data):
-                break
-                
-            control = data[pos]
-            pos += 1
-            
-            for i in range(8):
-                if len(output) >= size or pos >= len(data):
-                    break
-                    
-                if control & 0x80:  # Compressed
-                    if pos + 2 > len(data):
-                        break
-                    byte1, byte2 = data[pos], data[pos + 1]
-                    pos += 2
-                    
-                    distance = ((byte1 & 0xF) << 8) | byte2
-                    length = (byte1 >> 4) + 3
-                    
-                    if distance == 0:
-                        break
-                        
-                    for j in range(length):
-                        if len(output) > distance:
-                            output.append(output[len(output) - distance - 1])
-                        else:
-                            output.append(0)
-                else:  # Literal
-                    if pos < len(data):
-                        output.append(data[pos])
-                        pos += 1
-                    
-                control <<= 1
+        if njit is not None:
+            data = np.frombuffer(data, dtype=np.uint8)
+            out = np.empty(size + LZ77_OVERRUN, dtype=np.uint8)
+        else:
+            out = bytearray(size + LZ77_OVERRUN)  # Sized from the header, never grows
         
-        compressed_size = pos - start_pos
-        return bytes(output), f"OK ({compressed_size} -> {len(output)})"
+        out_len, pos = _lz77_decode(data, offset + 4, size, out)
+        
+        compressed_size = pos - (offset + 4)
+        # Slice through a memoryview so a bytearray buffer is copied only once
+        return bytes(memoryview(out)[:out_len]), f"OK ({compressed_size} -> {out_len})"
     except Exception as e:
         return None, f"Error: {e}"
 
 def extract_raw_tiles(data, offset, count=64):
-    """Extract raw 2BPP tiles from data"""
-    tiles = []
-    pos = offset
-    
-    for tile_num in range(count):
-        if pos + 16 > len(data):
-            break
-            
-        tile_data = data[pos:pos + 16]
-        tile = []
-        
-        for row in range(8):
-            if row * 2 + 1 < len(tile_data):
-                byte1 = tile_data[row * 2]
-                byte2 = tile_data[row * 2 + 1]
-                for bit in range(7, -1, -1):
-                    pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                    tile.append(pixel)
-        
-        if len(tile) == 64:
-            tiles.append(tile)
-        pos += 16
+    """Extract raw 2BPP tiles from data, as a (count, 64) uint8 array"""
+    count = max(0, min(count, (len(data) - offset) // 16))
+    if count == 0:
+        return np.zeros((0, 64), dtype=np.uint8)
     
-    return tiles
+    # Low and high bit planes of every row, unpacked MSB first
+    buf = np.frombuffer(data, dtype=np.uint8, offset=offset, count=count * 16).reshape(count, 8, 2)
+    p0 = np.unpackbits(buf[:, :, 0]).reshape(count, 8, 8)
+    p1 = np.unpackbits(buf[:, :, 1]).reshape(count, 8, 8)
+    return (p0 | (p1 << 1)).reshape(count, 64)
+
+def extract_1bpp_tiles(data):
+    """Extract 1BPP tiles from data, scaled to the 2BPP palette"""
+    count = len(data) // 8
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=count * 8))
+    return bits.reshape(-1, 64) * 3
+
+def extract_interleaved_tiles(data):
+    """Extract tiles from the first 16 bytes of every 32-byte block"""
+    # Even bytes of a block are plane 1 and odd bytes plane 2, which is
+    # exactly a 2BPP tile, so gather those halves and decode them as one
+    count = len(data) // 32
+    blocks = np.frombuffer(data, dtype=np.uint8, count=count * 32).reshape(count, 32)
+    return extract_raw_tiles(blocks[:, :16].ravel(), 0, count)
+
+# Game Boy palette, indexed by pixel value
+PALETTE = np.array([255, 170, 85, 0], dtype=np.uint8)
 
 def save_tileset(tiles, filename, tiles_per_row=16):
-    """Save tiles as PNG"""
-    if not tiles:
+    """Save an (N, 64) array of tiles as PNG, or as PGM for a .pgm filename"""
+    if len(tiles) == 0:
         return False
     
     rows = (len(tiles) + tiles_per_row - 1) // tiles_per_row
-    colors = [255, 170, 85, 0]  # Game Boy palette
     
-    image = []
-    for row in range(rows):
-        for y in range(8):
-            row_pixels = []
-            for col in range(tiles_per_row):
-                tile_idx = row * tiles_per_row + col
-                if tile_idx < len(tiles):
-                    tile = tiles[tile_idx]
-                    for x in range(8):
-                        pixel_value = tile[y * 8 + x]
-                        row_pixels.append(colors[pixel_value])
-                else:
-                    row_pixels.extend([255] * 8)
-            image.append(row_pixels)
+    # Pad the last row with colour 0 (white), then lay the tiles out as a grid
+    arr = np.zeros((rows * tiles_per_row, 64), dtype=np.uint8)
+    arr[:len(tiles)] = tiles
+    mosaic = arr.reshape(rows, tiles_per_row, 8, 8).transpose(0, 2, 1, 3).reshape(rows * 8, tiles_per_row * 8)
+    image = PALETTE[mosaic]
+    
+    if filename.endswith('.pgm'):
+        # Binary PGM: a short header and the raw greyscale bytes
+        with open(filename, 'wb') as f:
+            f.write(b"P5\n%d %d\n255\n" % (image.shape[1], image.shape[0]))
+            f.write(image.tobytes())
+        return True
     
     with open(filename, 'wb') as f:
-        w = png.Writer(width=len(image[0]), height=len(image), greyscale=True)
+        # Stored uncompressed, these are throwaway previews and deflate dominated the run
+        w = png.Writer(width=image.shape[1], height=image.shape[0], greyscale=True, compression=0)
         w.write(f, image)
     return True
 
+if njit is not None:
+    _LOW_BITS = np.uint64(0x0101010101010101)
+
+    @njit(cache=True)
+    def _nonzero_bytes(x):
+        """Number of non-zero bytes in a uint64 word, by SWAR"""
+        x |= x >> np.uint64(4)
+        x |= x >> np.uint64(2)
+        x |= x >> np.uint64(1)
+        x &= _LOW_BITS  # Low bit of each byte is now set if the byte was
+        return (x * _LOW_BITS) >> np.uint64(56)
+
+    @njit(cache=True)
+    def region_stats(a):
+        """Unique byte count and tile-like chunk count of a region"""
+        seen = np.zeros(256, dtype=np.bool_)
+        for b in a:
+            seen[b] = True
+        unique_bytes = 0
+        for v in range(256):
+            if seen[v]:
+                unique_bytes += 1
+        
+        # Each 16-byte chunk of the first 512 bytes is two uint64 words
+        words = a[:min(len(a), 512) // 16 * 16].view(np.uint64)
+        tile_score = 0
+        for i in range(0, len(words), 2):
+            non_zero = _nonzero_bytes(words[i]) + _nonzero_bytes(words[i + 1])
+            if 4 <= non_zero <= 12:
+                tile_score += 1
+        return unique_bytes, tile_score
+else:
+    def region_stats(a):
+        """Unique byte count and tile-like chunk count of a region"""
+        unique_bytes = int(np.count_nonzero(np.bincount(a, minlength=256)))
+        
+        chunks = a[:min(len(a), 512) // 16 * 16].reshape(-1, 16)
+        non_zero = np.count_nonzero(chunks, axis=1)
+        tile_score = int(np.count_nonzero((non_zero >= 4) & (non_zero <= 12)))
+        return unique_bytes, tile_score
+
+def is_blank_region(region):
+    """True if the region is constant or almost all zero bytes"""
+    return np.ptp(region) == 0 or np.count_nonzero(region) < 32
+
 def analyze_region_quality(data):
     """Score how much a region looks like graphics"""
     if len(data) < 64:
         return 0
     
-    # Check byte distribution
-    freq = Counter(data)
-    unique_bytes = len(freq)
+    # Check byte distribution, and for tile-like patterns in the first 512 bytes
+    unique_bytes, tile_score = region_stats(np.frombuffer(data, dtype=np.uint8))
     
     # Graphics have moderate entropy
     if unique_bytes < 8 or unique_bytes > 80:
         return 0
     
-    # Check for tile-like patterns
-    tile_score = 0
-    for i in range(0, min(len(data), 512), 16):
-        chunk = data[i:i+16]
-        if len(chunk) == 16:
-            non_zero = sum(1 for b in chunk if b != 0)
-            if 4 <= non_zero <= 12:
-                tile_score += 1
-    
     return tile_score + (40 - abs(unique_bytes - 32))
 
+def scan_region_lz77(rom_data, offsets):
+    """Try decompressing at each marker offset, returns the blocks worth saving"""
+    found = []
+    for search_offset in offsets:
+        # Try decompression
+        data, status = decompress_lz77_safe(rom_data, search_offset)
+        if data and len(data) >= MIN_LZ77_OUTPUT:
+            quality = analyze_region_quality(data)
+            if quality > 20:
+                # Extract as tiles
+                tiles = extract_raw_tiles(data, 0, min(len(data) // 16, 128))
+                if len(tiles):
+                    found.append((search_offset, status, tiles, quality))
+    return found
+
 def main():
+    parser = argparse.ArgumentParser(description="Targeted graphics extraction")
+    parser.add_argument('--pgm', action='store_true',
+                        help="write previews as raw PGM instead of PNG, for quick exploration")
+    args = parser.parse_args()
+    ext = 'pgm' if args.pgm else 'png'
+    
     rom_file = "Tetris (World) (ModRetro Chromatic) (Aftermarket) (Unl) 2.gbc"
     
+    # Map the ROM read-only, rom_np is a zero-copy array view of it
     with open(rom_file, 'rb') as f:
-        rom_data = f.read()
+        rom_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    rom_np = np.frombuffer(rom_data, dtype=np.uint8)
     
     print("🎯 Targeted Graphics Extraction")
     print("=" * 50)
@@ -172,39 +273,54 @@ def main():
     for offset, name in target_regions:
         if offset + 1024 > len(rom_data):
             continue
+        
+        # Blank or constant regions only produce empty tiles
+        if is_blank_region(rom_np[offset:offset + 1024]):
+            continue
             
         # Try as raw tiles
-        tiles = extract_raw_tiles(rom_data, offset, 64)
-        if tiles:
-            filename = f"targeted_extraction/{name}_raw.png"
+        tiles = extract_raw_tiles(rom_np, offset, 64)
+        if len(tiles):
+            filename = f"targeted_extraction/{name}_raw.{ext}"
             if save_tileset(tiles, filename):
                 # Analyze quality
-                region_data = rom_data[offset:offset + 1024]
+                region_data = rom_np[offset:offset + 1024]
                 quality = analyze_region_quality(region_data)
                 print(f"✅ {name}: {len(tiles)} tiles, quality={quality}")
     
     print("\n🗜️  Re-testing LZ77 blocks in promising regions:")
     
+    # Every 0x10 marker in the ROM, found once and sliced per region
+    marker_idx = np.flatnonzero(rom_np[:max(len(rom_np) - 3, 0)] == 0x10)
+    
+    # Reject on the size header up front: the decoder refuses sizes outside
+    # (0, 0x10000], and an output can't reach MIN_LZ77_OUTPUT bytes if even a
+    # final overrunning match leaves it short
+    sizes = (rom_np[marker_idx + 1].astype(np.uint32)
+             | (rom_np[marker_idx + 2].astype(np.uint32) << 8)
+             | (rom_np[marker_idx + 3].astype(np.uint32) << 16))
+    valid = (sizes + (LZ77_OVERRUN - 1) >= MIN_LZ77_OUTPUT) & (sizes <= 0x10000)
+    marker_idx = marker_idx[valid]
+    
     # Look for LZ77 blocks specifically in low-entropy areas
+    region_markers = []
     for offset, name in target_regions:
         region_start = offset
         region_end = min(offset + 4096, len(rom_data))
         
         # Search for 0x10 markers in this region
-        for search_offset in range(region_start, region_end - 4):
-            if rom_data[search_offset] == 0x10:
-                # Try decompression
-                data, status = decompress_lz77_safe(rom_data, search_offset)
-                if data and len(data) >= 256:
-                    quality = analyze_region_quality(data)
-                    if quality > 20:
-                        # Extract as tiles
-                        tiles = extract_raw_tiles(data, 0, min(len(data) // 16, 128))
-                        if tiles:
-                            rel_offset = search_offset - region_start
-                            filename = f"targeted_extraction/{name}_lz77_{rel_offset:04X}.png"
-                            if save_tileset(tiles, filename):
-                                print(f"✅ {name}+{rel_offset:04X}: LZ77 {status}, {len(tiles)} tiles, quality={quality}")
+        lo = np.searchsorted(marker_idx, region_start)
+        hi = np.searchsorted(marker_idx, region_end - 4)
+        region_markers.append(marker_idx[lo:hi].tolist())
+    
+    # The ten 4KB regions decode in a few milliseconds, far less than worker
+    # start-up would cost, so they stay in process
+    for (region_start, name), offsets in zip(target_regions, region_markers):
+        for search_offset, status, tiles, quality in scan_region_lz77(rom_data, offsets):
+            rel_offset = search_offset - region_start
+            filename = f"targeted_extraction/{name}_lz77_{rel_offset:04X}.{ext}"
+            if save_tileset(tiles, filename):
+                print(f"✅ {name}+{rel_offset:04X}: LZ77 {status}, {len(tiles)} tiles, quality={quality}")
     
     print("\n🎨 Testing alternative tile formats:")
     
@@ -218,51 +334,23 @@ def main():
         if offset + 1024 > len(rom_data):
             continue
             
-        region_data = rom_data[offset:offset + 1024]
+        region_data = rom_np[offset:offset + 1024]  # A view, shared by every check below
+        if is_blank_region(region_data):
+            continue
         
         # Test as 1BPP tiles
-        tiles_1bpp = []
-        for i in range(0, len(region_data), 8):
-            if i + 8 > len(region_data):
-                break
-            tile_data = region_data[i:i + 8]
-            tile = []
-            for byte in tile_data:
-                for bit in range(7, -1, -1):
-                    pixel = ((byte >> bit) & 1) * 3  # Convert to 2bpp scale
-                    tile.append(pixel)
-            if len(tile) == 64:
-                tiles_1bpp.append(tile)
+        tiles_1bpp = extract_1bpp_tiles(region_data)
         
-        if tiles_1bpp:
-            filename = f"targeted_extraction/{name}_1bpp.png"
+        if len(tiles_1bpp):
+            filename = f"targeted_extraction/{name}_1bpp.{ext}"
             if save_tileset(tiles_1bpp, filename):
                 print(f"✅ {name}: 1BPP format, {len(tiles_1bpp)} tiles")
         
         # Test as interleaved format (some homebrew games use this)
-        tiles_interleaved = []
-        for i in range(0, len(region_data) - 16, 32):
-            if i + 32 > len(region_data):
-                break
-                
-            # Take bytes 0,2,4,6,8,10,12,14 as plane 1
-            # Take bytes 1,3,5,7,9,11,13,15 as plane 2
-            plane1 = region_data[i:i+16:2]
-            plane2 = region_data[i+1:i+16:2]
-            
-            if len(plane1) == 8 and len(plane2) == 8:
-                tile = []
-                for row in range(8):
-                    byte1 = plane1[row]
-                    byte2 = plane2[row]
-                    for bit in range(7, -1, -1):
-                        pixel = ((byte1 >> bit) & 1) | (((byte2 >> bit) & 1) << 1)
-                        tile.append(pixel)
-                if len(tile) == 64:
-                    tiles_interleaved.append(tile)
+        tiles_interleaved = extract_interleaved_tiles(region_data)
         
-        if tiles_interleaved:
-            filename = f"targeted_extraction/{name}_interleaved.png"
+        if len(tiles_interleaved):
+            filename = f"targeted_extraction/{name}_interleaved.{ext}"
             if save_tileset(tiles_interleaved, filename):
                 print(f"✅ {name}: Interleaved format, {len(tiles_interleaved)} tiles")
     
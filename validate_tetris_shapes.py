@@ -12,33 +12,26 @@ def load_and_analyze_image(filepath):
         if img.mode != 'L':
             img = img.convert('L')
         
-        # Convert to numpy array
-        pixels = np.array(img)
+        # asarray keeps the buffer PIL exports, np.array would copy it again
+        pixels = np.asarray(img, dtype=np.uint8)
         
         # Basic analysis
         height, width = pixels.shape
         tiles_x = width // 8
         tiles_y = height // 8
         
-        # Look for non-empty tiles
-        meaningful_tiles = 0
-        tetris_candidates = []
+        # View the image as a (tiles_y, tiles_x, 8, 8) grid of 8x8 tiles
+        tiles = pixels[:tiles_y*8, :tiles_x*8].reshape(tiles_y, 8, tiles_x, 8).swapaxes(1, 2)
         
-        for ty in range(tiles_y):
-            for tx in range(tiles_x):
-                # Extract 8x8 tile
-                tile = pixels[ty*8:(ty+1)*8, tx*8:(tx+1)*8]
-                
-                # Count non-background pixels (not white/255)
-                non_bg = np.sum(tile < 250)
-                total_pixels = 64
-                
-                if 8 <= non_bg <= 56:  # Has some content but not solid
-                    meaningful_tiles += 1
-                    
-                    # Check for Tetris-like patterns
-                    if has_tetris_pattern(tile):
-                        tetris_candidates.append((tx, ty, tile))
+        # Count non-background pixels (not white/255) in every tile at once
+        mask = tiles < 250
+        non_bg = mask.sum(axis=(2, 3))
+        meaningful = (non_bg >= 8) & (non_bg <= 56)  # Has some content but not solid
+        meaningful_tiles = int(np.count_nonzero(meaningful))
+        
+        # Check the meaningful tiles for Tetris-like patterns, in reading order
+        candidates = meaningful & tetris_pattern_mask(mask)
+        tetris_candidates = [(tx, ty, tiles[ty, tx]) for ty, tx in np.argwhere(candidates).tolist()]
         
         return {
             'width': width,
@@ -51,30 +44,28 @@ def load_and_analyze_image(filepath):
     except Exception as e:
         return {'error': str(e)}
 
-def has_tetris_pattern(tile):
-    """Check if 8x8 tile looks like it could contain part of a Tetris piece"""
+def tetris_pattern_mask(mask):
+    """has_tetris_pattern for every (..., 8, 8) non-background mask at once"""
     # Look for connected shapes, not just noise
     
     # Check for horizontal/vertical lines (common in Tetris pieces)
-    for row in tile:
-        non_bg_in_row = np.sum(row < 250)
-        if 3 <= non_bg_in_row <= 7:  # Partial line
-            return True
-    
-    for col in range(8):
-        column = tile[:, col]
-        non_bg_in_col = np.sum(column < 250)
-        if 3 <= non_bg_in_col <= 7:  # Partial line
-            return True
+    row_nz = mask.sum(axis=-1)
+    col_nz = mask.sum(axis=-2)
+    has_line = (((row_nz >= 3) & (row_nz <= 7)).any(axis=-1)  # Partial line
+                | ((col_nz >= 3) & (col_nz <= 7)).any(axis=-1))
     
-    # Check for rectangular blocks (common in Tetris)
-    for y in range(6):  # 2x2 blocks
-        for x in range(6):
-            block = tile[y:y+2, x:x+2]
-            if np.sum(block < 250) >= 3:  # Mostly filled 2x2
-                return True
+    # Check for rectangular blocks (common in Tetris): 2x2 block sums at
+    # the top-left 6x6 positions, from an integral image of each tile
+    ii = np.zeros(mask.shape[:-2] + (9, 9), dtype=np.int32)
+    ii[..., 1:, 1:] = mask.cumsum(axis=-2).cumsum(axis=-1)
+    block = ii[..., 2:8, 2:8] - ii[..., :6, 2:8] - ii[..., 2:8, :6] + ii[..., :6, :6]
+    has_block = (block >= 3).any(axis=(-2, -1))  # Mostly filled 2x2
     
-    return False
+    return has_line | has_block
+
+def has_tetris_pattern(tile):
+    """Check if 8x8 tile looks like it could contain part of a Tetris piece"""
+    return bool(tetris_pattern_mask(tile < 250))
 
 def print_tile_ascii(tile):
     """Print tile as ASCII for visual inspection"""